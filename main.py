@@ -12,13 +12,12 @@
 
 import re
 import sys
-from datetime import datetime
+from datetime import date, datetime, time
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-from openpyxl.utils.dataframe import dataframe_to_rows
+import xlsxwriter
 
 
 # ============== 险种分类映射 ==============
@@ -44,6 +43,16 @@ CORE_ELEMENTS = {
     '其他类': ['损失类型', '后续处理'],
 }
 
+# 核心要素模糊匹配模式（"类型"、"方式"允许中间插入少量字符），其余要素直接子串匹配
+CORE_ELEMENT_PATTERNS = {
+    category: [
+        (element, re.compile(element.replace('类型', '.{0,2}类型?').replace('方式', '.{0,2}方式?')))
+        if '类型' in element or '方式' in element else (element, None)
+        for element in elements
+    ]
+    for category, elements in CORE_ELEMENTS.items()
+}
+
 # ============== 必填项正则模式 ==============
 MANDATORY_PATTERNS = {
     '查勘时间': r'查勘.{0,3}时间|于.{0,10}(查勘|勘查)|查勘.{0,5}日期',
@@ -52,13 +61,30 @@ MANDATORY_PATTERNS = {
     '出险时间': r'出险.{0,3}时间|事故.{0,3}时间|发生.{0,5}时间|于.{0,10}(出险|发生)',
     '出险地点': r'出险.{0,3}地点|事故.{0,3}地点|发生.{0,5}地点|位于.{0,10}发生',
 }
+MANDATORY_PATTERNS = {item: re.compile(pattern) for item, pattern in MANDATORY_PATTERNS.items()}
 
 # ============== 报案延迟关键词 ==============
 DELAY_KEYWORDS = ['延迟原因', '原因', '核实', '属实']
+# 已被更短关键词覆盖的关键词（如"延迟原因"包含"原因"）无需参与匹配
+DELAY_PATTERN = re.compile('|'.join(
+    re.escape(keyword) for keyword in DELAY_KEYWORDS
+    if not any(other != keyword and other in keyword for other in DELAY_KEYWORDS)
+))
+
+# ============== 判定阈值 ==============
+DELAY_DAYS_LIMIT = 7      # 报案延迟超过该天数需说明原因
+OVERLAP_THRESHOLD = 0.8   # 摘要重合率达到该比例判定不合格
+
+# ============== 不合格原因位标记 ==============
+REASON_MANDATORY = 1 << 0
+REASON_DELAY = 1 << 1
+REASON_CORE = 1 << 2
+REASON_OVERLAP = 1 << 3
 
 # ============== 机构排序规则 ==============
 INSTITUTION_ORDER = ['合肥', '芜湖', '蚌埠', '淮南', '马鞍山', '淮北', '铜陵', '安庆', '黄山', 
                      '滁州', '阜阳', '宿州', '六安', '亳州', '池州', '宣城']
+INSTITUTION_RANK = {institution: i for i, institution in enumerate(INSTITUTION_ORDER)}
 
 
 def classify_insurance(insurance_type: str) -> str:
@@ -73,6 +99,25 @@ def classify_insurance(insurance_type: str) -> str:
     return '其他类'
 
 
+def cell_values(values: pd.Series) -> list:
+    """取出列原始值，缺失值（NaN、NaT）统一为 None"""
+    return values.astype(object).where(values.notna(), None).tolist()
+
+
+def summary_values(df: pd.DataFrame, column: str, default) -> list:
+    """取出摘要列原始值，缺失值统一为 None（NaN 互不相等，无法作为去重键）"""
+    if column not in df.columns:
+        return [default] * len(df)
+    return cell_values(df[column])
+
+
+def classify_insurance_column(insurance_types: pd.Series) -> list:
+    """整列险种分类：每个不同险种只分类一次"""
+    codes, uniques = pd.factorize(insurance_types)
+    categories = [classify_insurance(value) for value in uniques]
+    return [categories[code] if code >= 0 else '其他类' for code in codes]
+
+
 def check_mandatory(survey_summary: str) -> tuple[bool, list]:
     """
     规则一：必填项目校验
@@ -85,51 +130,66 @@ def check_mandatory(survey_summary: str) -> tuple[bool, list]:
     missing = []
     
     for item, pattern in MANDATORY_PATTERNS.items():
-        if not re.search(pattern, text):
+        if not pattern.search(text):
             missing.append(item)
     
     return len(missing) == 0, missing
 
 
-def check_delay(accident_time, report_time, survey_summary: str) -> tuple[bool, bool, str]:
+def parse_time(value):
+    """解析单个时间值，无法解析时返回 NaT"""
+    try:
+        if isinstance(value, str):
+            return pd.to_datetime(value)
+        return pd.Timestamp(value)
+    except (ValueError, TypeError):
+        return pd.NaT
+
+
+def delay_days_between(accident_time, report_time) -> float:
+    """计算单个案件的报案延迟天数，缺失或无法相减（如带时区与不带时区）时返回 NaN"""
+    accident_dt = parse_time(accident_time)
+    report_dt = parse_time(report_time)
+    if pd.isna(accident_dt) or pd.isna(report_dt):
+        return np.nan
+    try:
+        return (report_dt - accident_dt).days
+    except (ValueError, TypeError):
+        return np.nan
+
+
+def compute_delay_days(accident_times: pd.Series, report_times: pd.Series) -> pd.Series:
+    """整列计算报案延迟天数，无法解析的时间记为缺失"""
+    try:
+        accident_dt = pd.to_datetime(accident_times, errors='coerce', format='mixed')
+        report_dt = pd.to_datetime(report_times, errors='coerce', format='mixed')
+        return (report_dt - accident_dt).dt.days
+    except (ValueError, TypeError):
+        # 时区混杂等无法整列处理的情况，退回逐行解析
+        return pd.Series(
+            [delay_days_between(accident, report) for accident, report in zip(accident_times, report_times)],
+            index=accident_times.index,
+            dtype=np.float64,
+        )
+
+
+def check_delay(delay_days, survey_summary: str) -> tuple[bool, bool, str]:
     """
     规则二：报案延迟风险识别
     返回：(是否触发延迟, 是否通过校验, 原因说明)
     """
-    try:
-        if pd.isna(accident_time) or pd.isna(report_time):
-            return False, True, ''
-        
-        # 解析时间
-        if isinstance(accident_time, str):
-            accident_dt = pd.to_datetime(accident_time)
-        else:
-            accident_dt = pd.Timestamp(accident_time)
-            
-        if isinstance(report_time, str):
-            report_dt = pd.to_datetime(report_time)
-        else:
-            report_dt = pd.Timestamp(report_time)
-        
-        # 计算延迟天数
-        delay_days = (report_dt - accident_dt).days
-        
-        if delay_days <= 7:
-            return False, True, ''
-        
-        # 触发延迟，检查查勘摘要
-        if pd.isna(survey_summary):
-            return True, False, f'报案延迟{delay_days}天，查勘摘要未填写延迟原因'
-        
-        text = str(survey_summary)
-        for keyword in DELAY_KEYWORDS:
-            if keyword in text:
-                return True, True, ''
-        
-        return True, False, f'报案延迟{delay_days}天，查勘摘要未包含延迟原因说明'
-        
-    except Exception as e:
+    if pd.isna(delay_days) or delay_days <= DELAY_DAYS_LIMIT:
         return False, True, ''
+    
+    # 触发延迟，检查查勘摘要
+    delay_days = int(delay_days)
+    if pd.isna(survey_summary):
+        return True, False, f'报案延迟{delay_days}天，查勘摘要未填写延迟原因'
+    
+    if DELAY_PATTERN.search(str(survey_summary)):
+        return True, True, ''
+    
+    return True, False, f'报案延迟{delay_days}天，查勘摘要未包含延迟原因说明'
 
 
 def check_core_elements(category: str, survey_summary: str) -> tuple[bool, int, list]:
@@ -143,23 +203,20 @@ def check_core_elements(category: str, survey_summary: str) -> tuple[bool, int,
     
     text = str(survey_summary)
     elements = CORE_ELEMENTS.get(category, CORE_ELEMENTS['其他类'])
+    patterns = CORE_ELEMENT_PATTERNS.get(category, CORE_ELEMENT_PATTERNS['其他类'])
     
-    matched = []
-    missing = []
-    
-    for element in elements:
-        # 使用模糊匹配
-        pattern = element.replace('类型', '.{0,2}类型?').replace('方式', '.{0,2}方式?')
-        if re.search(pattern, text) or element in text:
-            matched.append(element)
-        else:
-            missing.append(element)
+    # 使用模糊匹配（模糊模式同样能匹配原词），只需收集缺失要素
+    missing = [
+        element for element, pattern in patterns
+        if not (pattern.search(text) if pattern else element in text)
+    ]
+    matched_count = len(elements) - len(missing)
     
     # 至少匹配3个核心要素
     min_required = min(3, len(elements))
-    passed = len(matched) >= min_required
+    passed = matched_count >= min_required
     
-    return passed, len(matched), missing
+    return passed, matched_count, missing
 
 
 def check_overlap(report_summary: str, survey_summary: str) -> tuple[bool, float]:
@@ -176,6 +233,10 @@ def check_overlap(report_summary: str, survey_summary: str) -> tuple[bool, float
     if not report_text or not survey_text:
         return True, 0.0
     
+    # 两段摘要完全相同时重合率必为 100%，无需构造字符集
+    if report_text == survey_text:
+        return False, 1.0
+    
     # 计算重合字符
     report_chars = set(report_text)
     survey_chars = set(survey_text)
@@ -186,72 +247,121 @@ def check_overlap(report_summary: str, survey_summary: str) -> tuple[bool, float
     overlap_rate = len(overlap_chars) / max_len if max_len > 0 else 0
     
     # 重合率 < 80% 为合格（查勘摘要应有独立信息）
-    return overlap_rate < 0.8, overlap_rate
+    return overlap_rate < OVERLAP_THRESHOLD, overlap_rate
 
 
-def evaluate_case(row: pd.Series) -> tuple[str, str]:
+def dedupe(keys) -> tuple[list, np.ndarray]:
     """
-    综合评估单个案件
-    返回：(判定结果, 不合格原因)
+    去重（模板化摘要大量重复，文本判定只需对唯一值计算一次）
+    返回：(唯一键列表, 每行对应的唯一键下标)
     """
-    reasons = []
-    
-    # 获取必要字段
-    insurance_type = row.get('险种', '')
-    accident_time = row.get('出险时间', None)
-    report_time = row.get('报案时间', None)
-    report_summary = row.get('报案摘要', '')
-    survey_summary = row.get('查勘摘要', '')
+    index = {}
+    codes = [index.setdefault(key, len(index)) for key in keys]
+    return list(index), np.array(codes, dtype=np.intp)
+
+
+def compute_overlap_rates(report_summaries, survey_summaries) -> np.ndarray:
+    """整列计算摘要重合率（相同摘要组合只计算一次）"""
+    pairs, codes = dedupe(zip(report_summaries, survey_summaries))
+    rates = np.fromiter(
+        (check_overlap(report, survey)[1] for report, survey in pairs),
+        dtype=np.float64,
+        count=len(pairs),
+    )
+    return rates[codes]
+
+
+def evaluate_summary(category: str, survey_summary) -> tuple[int, tuple]:
+    """
+    查勘摘要文本判定（规则一、规则三）
+    返回：(不合格原因位掩码, 原因说明所需信息)
+    """
+    mandatory_pass, mandatory_missing = check_mandatory(survey_summary)
+    core_pass, core_count, core_missing = check_core_elements(category, survey_summary)
+    min_required = min(3, len(CORE_ELEMENTS.get(category, CORE_ELEMENTS['其他类'])))
     
-    # 险种分类
-    category = classify_insurance(insurance_type)
+    reason_code = (0 if mandatory_pass else REASON_MANDATORY) | (0 if core_pass else REASON_CORE)
+    return reason_code, (mandatory_missing, min_required, core_count, core_missing)
+
+
+def judge_cases(summary_codes: np.ndarray, delay_failed: np.ndarray,
+                overlap_failed: np.ndarray) -> np.ndarray:
+    """
+    整列汇总四条规则的判定结果
+    返回：不合格原因位掩码数组（0 表示合格）
+    """
+    return (
+        summary_codes
+        | delay_failed * REASON_DELAY
+        | overlap_failed * REASON_OVERLAP
+    ).astype(np.uint8)
+
+
+def render_reasons(reason_code: int, summary_context: tuple, delay_reason: str, overlap_rate: float) -> str:
+    """将不合格原因位掩码还原为文字说明"""
+    mandatory_missing, min_required, core_count, core_missing = summary_context
+    reasons = []
     
-    # 规则一：必填项校验
-    mandatory_pass, mandatory_missing = check_mandatory(survey_summary)
-    if not mandatory_pass:
+    if reason_code & REASON_MANDATORY:
         reasons.append(f"必填项缺失：{', '.join(mandatory_missing)}")
-    
-    # 规则二：报案延迟识别
-    delay_triggered, delay_pass, delay_reason = check_delay(accident_time, report_time, survey_summary)
-    if delay_triggered and not delay_pass:
+    if reason_code & REASON_DELAY:
         reasons.append(delay_reason)
-    
-    # 规则三：核心要素匹配
-    core_pass, core_count, core_missing = check_core_elements(category, survey_summary)
-    if not core_pass:
-        min_required = min(3, len(CORE_ELEMENTS.get(category, CORE_ELEMENTS['其他类'])))
+    if reason_code & REASON_CORE:
         reasons.append(f"核心要素不足（需{min_required}个，仅{core_count}个），建议补充：{', '.join(core_missing[:3])}")
+    if reason_code & REASON_OVERLAP:
+        reasons.append(f"查勘摘要与报案摘要重合率过高（{overlap_rate:.1%}），缺乏独立调查信息")
+    
+    return '；'.join(reasons)
+
+
+def evaluate_cases(categories, delay_days: np.ndarray, overlap_rates: np.ndarray,
+                   survey_summaries) -> tuple[np.ndarray, list]:
+    """
+    整列综合评估案件（categories 为险种分类结果，delay_days 为报案延迟天数，
+    overlap_rates 为摘要重合率）
+    返回：(不合格原因位掩码数组, 不合格原因列表)
+    """
+    # 规则一、规则三：查勘摘要文本判定（相同分类与摘要只判定一次）
+    keys, codes = dedupe(zip(categories, survey_summaries))
+    summary_results = [evaluate_summary(category, summary) for category, summary in keys]
+    summary_codes = np.array([code for code, _ in summary_results], dtype=np.uint8)[codes]
+    
+    # 规则二：报案延迟识别（仅延迟超过期限的案件需要检查摘要）
+    delay_reasons = {}
+    for i in np.flatnonzero(delay_days > DELAY_DAYS_LIMIT):
+        _, delay_pass, delay_reason = check_delay(delay_days[i], survey_summaries[i])
+        if not delay_pass:
+            delay_reasons[i] = delay_reason
+    delay_failed = np.zeros(len(survey_summaries), dtype=bool)
+    delay_failed[np.fromiter(delay_reasons, dtype=np.intp, count=len(delay_reasons))] = True
     
     # 规则四：摘要重合率
-    overlap_pass, overlap_rate = check_overlap(report_summary, survey_summary)
-    if not overlap_pass:
-        reasons.append(f"查勘摘要与报案摘要重合率过高（{overlap_rate:.1%}），缺乏独立调查信息")
+    overlap_failed = overlap_rates >= OVERLAP_THRESHOLD
+    
+    # 综合判定，仅为不合格案件生成原因说明
+    reason_codes = judge_cases(summary_codes, delay_failed, overlap_failed)
+    reasons = [''] * len(survey_summaries)
+    for i in np.flatnonzero(reason_codes):
+        reasons[i] = render_reasons(
+            reason_codes[i], summary_results[codes[i]][1], delay_reasons.get(i, ''), overlap_rates[i]
+        )
     
-    # 综合判定
-    if reasons:
-        return '不合格', '；'.join(reasons)
-    else:
-        return '合格', ''
+    return reason_codes, reasons
 
 
-def create_summary_sheet(df: pd.DataFrame) -> pd.DataFrame:
-    """创建机构汇总表"""
+def create_summary_sheet(df: pd.DataFrame, qualified: np.ndarray) -> pd.DataFrame:
+    """创建机构汇总表（qualified 为各案件是否合格）"""
     # 按机构统计
-    summary = df.groupby('机构').agg(
+    summary = df.assign(是否合格=qualified).groupby('机构', observed=True).agg(
         总案件数=('判定结果', 'count'),
-        合格案件数=('判定结果', lambda x: (x == '合格').sum())
+        合格案件数=('是否合格', 'sum')
     ).reset_index()
+    summary['机构'] = summary['机构'].astype(object)
     
     summary['合格率'] = (summary['合格案件数'] / summary['总案件数'] * 100).round(1).astype(str) + '%'
     
-    # 按预设顺序排序
-    def sort_key(institution):
-        try:
-            return INSTITUTION_ORDER.index(institution)
-        except ValueError:
-            return len(INSTITUTION_ORDER)
-    
-    summary['排序'] = summary['机构'].apply(sort_key)
+    # 按预设顺序排序（未列出的机构排在最后）
+    summary['排序'] = summary['机构'].map(INSTITUTION_RANK).fillna(len(INSTITUTION_ORDER)).astype(int)
     summary = summary.sort_values('排序').drop('排序', axis=1)
     
     # 添加合计行
@@ -271,45 +381,55 @@ def create_summary_sheet(df: pd.DataFrame) -> pd.DataFrame:
     return summary
 
 
-def style_excel(wb: Workbook):
-    """美化 Excel 样式"""
-    header_font = Font(bold=True, color='FFFFFF')
-    header_fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
-    header_alignment = Alignment(horizontal='center', vertical='center')
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-    
-    for ws in wb.worksheets:
-        # 设置表头样式
-        for cell in ws[1]:
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = header_alignment
-            cell.border = thin_border
-        
-        # 设置数据行样式
-        for row in ws.iter_rows(min_row=2):
-            for cell in row:
-                cell.border = thin_border
-                cell.alignment = Alignment(vertical='center', wrap_text=True)
-        
-        # 自动调整列宽
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    cell_length = len(str(cell.value)) if cell.value else 0
-                    if cell_length > max_length:
-                        max_length = cell_length
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
+def column_width(header, values: list) -> int:
+    """按表头和单元格内容计算列宽（与写入 Excel 的文本长度一致，空值计 0）"""
+    lengths = [len(str(value)) if value else 0 for value in values]
+    max_length = max(lengths + [len(str(header))])
+    return min(max_length + 2, 50)
+
+
+def create_formats(workbook: xlsxwriter.Workbook) -> dict:
+    """创建 Excel 单元格样式"""
+    body = {'valign': 'vcenter', 'text_wrap': True, 'border': 1}
+    return {
+        'header': workbook.add_format({
+            'bold': True, 'font_color': '#FFFFFF', 'bg_color': '#4472C4', 'pattern': 1,
+            'align': 'center', 'valign': 'vcenter', 'border': 1,
+        }),
+        'body': workbook.add_format(body),
+        'datetime': workbook.add_format({**body, 'num_format': 'yyyy-mm-dd hh:mm:ss'}),
+        'date': workbook.add_format({**body, 'num_format': 'yyyy-mm-dd'}),
+        'time': workbook.add_format({**body, 'num_format': 'hh:mm:ss'}),
+    }
+
+
+def write_sheet(workbook: xlsxwriter.Workbook, sheet_name: str, data: pd.DataFrame, formats: dict):
+    """按行写入工作表并设置样式、列宽"""
+    worksheet = workbook.add_worksheet(sheet_name)
+    
+    # 各列取值只转换一次，列宽计算与写入共用
+    columns = [cell_values(data[column]) for column in data.columns]
+    
+    # 自动调整列宽（直接由源数据计算）
+    for col, (column, values) in enumerate(zip(data.columns, columns)):
+        worksheet.set_column(col, col, column_width(column, values))
+    
+    # 表头
+    worksheet.write_row(0, 0, [str(column) for column in data.columns], formats['header'])
+    
+    # 数据行（空值写为带边框的空白单元格）
+    for row, values in enumerate(zip(*columns), start=1):
+        for col, value in enumerate(values):
+            if value is None:
+                worksheet.write_blank(row, col, None, formats['body'])
+            elif isinstance(value, datetime):
+                worksheet.write_datetime(row, col, value, formats['datetime'])
+            elif isinstance(value, date):
+                worksheet.write_datetime(row, col, value, formats['date'])
+            elif isinstance(value, time):
+                worksheet.write_datetime(row, col, value, formats['time'])
+            else:
+                worksheet.write(row, col, value, formats['body'])
 
 
 def main():
@@ -332,40 +452,57 @@ def main():
     
     try:
         # 读取 Excel
-        df = pd.read_excel(input_file)
+        df = pd.read_excel(input_file, engine='calamine')
         print(f"读取到 {len(df)} 条记录")
         
-        # 执行判定
-        results = df.apply(evaluate_case, axis=1)
-        df['判定结果'] = results.apply(lambda x: x[0])
-        df['不合格原因'] = results.apply(lambda x: x[1])
+        # 险种分类（整列计算一次）
+        categories = classify_insurance_column(df['险种'])
+        
+        # 报案延迟天数（整列解析时间）
+        missing_column = pd.Series(None, index=df.index, dtype=object)
+        accident_times = df.get('出险时间', missing_column)
+        report_times = df.get('报案时间', missing_column)
+        delay_days = compute_delay_days(accident_times, report_times).to_numpy()
+        
+        # 摘要重合率（整列计算）
+        report_summaries = summary_values(df, '报案摘要', '')
+        survey_summaries = summary_values(df, '查勘摘要', '')
+        overlap_rates = compute_overlap_rates(report_summaries, survey_summaries)
+        
+        # 执行判定（按列取出原始值判定，避免构造行 Series）
+        reason_codes, reasons = evaluate_cases(categories, delay_days, overlap_rates, survey_summaries)
+        qualified = reason_codes == 0
+        df['判定结果'] = np.where(qualified, '合格', '不合格')
+        df['不合格原因'] = reasons
         
         # 添加险种分类列（辅助分析）
-        df['险种分类'] = df['险种'].apply(classify_insurance)
+        df['险种分类'] = categories
+        
+        # 低基数字段转为分类类型，节省内存并加速分组统计
+        for col in ('机构', '险种分类', '判定结果'):
+            df[col] = df[col].astype('category')
         
         # 创建汇总表
-        summary_df = create_summary_sheet(df)
+        summary_df = create_summary_sheet(df, qualified)
         
         # 输出结果
         output_file = input_file.parent / f"判定结果_{input_file.stem}.xlsx"
         
-        with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
-            summary_df.to_excel(writer, sheet_name='机构汇总表', index=False)
-            df.to_excel(writer, sheet_name='案件清单表', index=False)
-        
-        # 美化样式
-        from openpyxl import load_workbook
-        wb = load_workbook(output_file)
-        style_excel(wb)
-        wb.save(output_file)
+        sheets = {'机构汇总表': summary_df, '案件清单表': df}
+        # 关闭网址自动转超链接：与原输出一致按纯文本写入，且超长网址不会被丢弃
+        workbook_options = {'constant_memory': True, 'strings_to_urls': False}
+        with xlsxwriter.Workbook(output_file, workbook_options) as workbook:
+            formats = create_formats(workbook)
+            for sheet_name, data in sheets.items():
+                write_sheet(workbook, sheet_name, data, formats)
         
         # 输出统计
         total = len(df)
-        qualified = (df['判定结果'] == '合格').sum()
+        qualified_count = qualified.sum()
         print(f"\n判定完成！")
         print(f"  总案件数：{total}")
-        print(f"  合格案件：{qualified}")
-        print(f"  合格率：{qualified/total*100:.1f}%")
+        print(f"  合格案件：{qualified_count}")
+        print(f"  合格率：{qualified_count/total*100:.1f}%")
         print(f"\n结果已保存至：{output_file}")
         
     except Exception as e: